@@ -0,0 +1,9 @@
+from main.database.models import db
+from main.app import app
+
+# (Re)build the ward_list view behind /api/v1/wards from the candidates already
+# in the database, e.g. after upgrading an existing deployment. No reseed needed.
+from main.database.models.build_db import build_ward_list
+
+build_ward_list(db)
+db.session.commit()
@@ -0,0 +1,13 @@
+# Gunicorn settings, picked up automatically when gunicorn is started from the project root.
+# The API endpoints spend most of their time waiting on Postgres, so workers use gevent to
+# keep many requests in flight per process instead of serializing them.
+worker_class = 'gevent'
+# Greenlets beyond the worker's database pool (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW in
+# main/app.py) wait for a free connection. Keep workers * pool within Postgres max_connections.
+worker_connections = 1000
+
+
+def post_fork(server, worker):
+    # Make psycopg2 yield to the gevent hub while waiting on the database
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
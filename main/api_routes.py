@@ -1,33 +1,208 @@
-from flask import jsonify, request
+from flask import Response, request, stream_with_context
+from werkzeug.exceptions import HTTPException
 from .database.models import db
+from .app import cache
 from .decorators import get_candidates
 from sqlalchemy import text
+from psycopg2.extensions import QueryCanceledError
+from dataclasses import dataclass
 import logging
+import orjson
+import re
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+# Ward code field names are interpolated into SQL, so only plain identifiers are accepted
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# Ward IDs may be codes or names ("Homa Bay", "Murang'A", "Elgeyo/Marakwet"); they are only
+# ever bound as query parameters, so just the length is capped before touching the database
+_WARD_ID_MAX_LENGTH = 100
+
+# Numeric sort key for the TEXT orderno column. Values that are not whole numbers ('', 'NaN', ...)
+# sort last instead of failing the cast; '1.0' from a float column in pandas sorts as 1.
+# The seeded candidates index uses the same expression so the query can read rows in index order.
+ORDERNO_SORT_KEY = r"CASE WHEN orderno ~ '^[0-9]{1,9}(\.0+)?$' THEN CAST(CAST(orderno AS NUMERIC) AS INTEGER) END"
+
+# candidate_type -> ward code field name, filled on first successful lookup. Seeding runs in
+# its own process and cannot clear this, so entries expire after _WARD_CODE_CACHE_TTL seconds.
+_WARD_CODE_CACHE_TTL = 300
+_ward_code_cache = {}
+_ward_code_cache_loaded_at = None
+# Held by the one request per worker that reloads an expired cache
+_ward_code_cache_lock = threading.Lock()
+
+# Rows fetched per round trip from the server-side cursor behind ?stream=true
+_STREAM_BATCH_SIZE = 500
+
+# ward code field name -> prebuilt text() statement, so each field yields one stable SQL string
+_candidates_queries = {}
+
+# Locator of every candidate type, used to resolve ward code field names. The distinct types
+# are walked one index probe at a time (a loose index scan over the candidate_type-leading
+# indexes created at seed time) instead of grouping every row of the candidates table.
+_WARD_CODES_QUERY = text("""
+    WITH RECURSIVE candidate_types AS (
+        SELECT min(candidate_type) AS candidate_type FROM candidates
+        UNION ALL
+        SELECT (
+            SELECT min(candidate_type) FROM candidates
+            WHERE candidate_type > candidate_types.candidate_type
+        )
+        FROM candidate_types
+        WHERE candidate_types.candidate_type IS NOT NULL
+    )
+    SELECT candidate_type, (
+        SELECT locator FROM candidates
+        WHERE candidates.candidate_type = candidate_types.candidate_type
+        LIMIT 1
+    )
+    FROM candidate_types
+    WHERE candidate_type IS NOT NULL
+""")
+
+# Distinct wards per candidate type, precomputed by the ward_list materialized view at seed time.
+# The ward objects are serialized to JSON by Postgres and embedded in the response as-is.
+_WARDS_QUERY = text("""
+    SELECT COALESCE(json_agg(json_build_object('ward_id', ward_id) ORDER BY ward_id), '[]')::text,
+           count(*)
+    FROM ward_list
+    WHERE candidate_type = :candidate_type
+""")
+
+@dataclass(slots=True)
+class Candidate:
+    """
+    A candidate row as returned by the ward candidates API.
+    Fields follow the candidates query's column order; the ward code field is aliased to ward_code.
+    """
+    id: str
+    name: str
+    party: str
+    orderno: str
+    ward_code: str
+    candidate_type: str
+
+def _json(obj, status=200):
+    """
+    Build a JSON response, encoding with orjson instead of the stdlib encoder used by jsonify.
+    orjson serializes dataclasses such as Candidate natively.
+    """
+    return Response(orjson.dumps(obj, default=str), status=status, mimetype='application/json')
+
+def _statement_timed_out(error):
+    """
+    Whether a database error was raised because the statement exceeded statement_timeout.
+    """
+    return isinstance(getattr(error, 'orig', None), QueryCanceledError)
+
+def _is_cacheable(response):
+    """
+    Only successful, fully built responses are kept in the response cache.
+    """
+    return response.status_code == 200 and not response.is_streamed
+
+def _stream_requested():
+    """
+    Whether the client asked for a streamed (and therefore uncached) response.
+    """
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+def clear_ward_code_cache():
+    """
+    Forget cached ward code field names, e.g. after the candidates table is reseeded in-process.
+    """
+    global _ward_code_cache_loaded_at
+    _ward_code_cache.clear()
+    _ward_code_cache_loaded_at = None
+
+def _ward_code_cache_is_fresh():
+    """
+    Whether the cached ward code field names were loaded within the last _WARD_CODE_CACHE_TTL seconds.
+    """
+    return (_ward_code_cache_loaded_at is not None
+            and time.monotonic() - _ward_code_cache_loaded_at < _WARD_CODE_CACHE_TTL)
+
+def _parse_ward_code(locator):
+    """
+    Return the ward code field name from a stored locator array, e.g. '{ward_code,ward_name}'.
+    """
+    # First field is typically the ward code; partition stops at the first comma
+    locator = locator[1:] if locator.startswith('{') else locator
+    return locator.partition(',')[0].rstrip('}').strip('" ')
+
+def load_ward_codes():
+    """
+    Read the ward code field name of every candidate type from the candidates table.
+    Fields that are not plain identifiers are skipped, as they would be interpolated into SQL.
+    
+    Returns:
+        dict: Maps each candidate_type to its ward code field name
+    """
+    result = db.session.execute(_WARD_CODES_QUERY)
+    ward_codes = {}
+    for row in result.fetchall():
+        if not row[1]:
+            continue
+        ward_code = _parse_ward_code(row[1])
+        if _IDENTIFIER_RE.fullmatch(ward_code):
+            ward_codes[row[0]] = ward_code
+        else:
+            logger.warning("Ignoring invalid ward code field %r for candidate type %s", ward_code, row[0])
+    return ward_codes
+
 def get_ward_code_for_candidate_type(candidate_type):
     """
     Get the ward code field name for a given candidate type.
     This function determines which field contains the ward information.
+    Successful lookups are cached per process for _WARD_CODE_CACHE_TTL seconds; database
+    errors are raised to the caller and the lookup is retried on the next call.
+    An expired or empty cache loads the ward code of every candidate type in a single
+    query, so the candidates query is the only round trip once the cache is warm. That
+    load is complete, so unknown types are not queried again until it expires.
+    Only one request per worker reloads an expired cache; concurrent requests keep
+    answering from the expired map meanwhile, and only wait when there is none yet.
     """
+    global _ward_code_cache_loaded_at
+    if _ward_code_cache_is_fresh():
+        return _ward_code_cache.get(candidate_type)
+
+    if not _ward_code_cache_lock.acquire(blocking=_ward_code_cache_loaded_at is None):
+        return _ward_code_cache.get(candidate_type)
     try:
-        # Get the locator information for the candidate type
-        distinct_types_query = """
-            SELECT DISTINCT candidate_type, locator FROM candidates
-            WHERE candidate_type = :candidate_type
-            LIMIT 1
-        """
-        result = db.session.execute(distinct_types_query, {'candidate_type': candidate_type})
-        row = result.fetchone()
+        # Another request may have reloaded the cache while this one waited for the lock
+        if _ward_code_cache_is_fresh():
+            return _ward_code_cache.get(candidate_type)
         
-        if row:
-            locator_values = row[1].strip("{}").split(',')
-            return locator_values[0]  # First field is typically the ward code
-        return None
-    except Exception as e:
-        logger.error(f"Error getting ward code for candidate type {candidate_type}: {e}")
-        return None
+        # Get the locator information for all candidate types
+        ward_codes = load_ward_codes()
+        
+        _ward_code_cache.clear()
+        _ward_code_cache.update(ward_codes)
+        _ward_code_cache_loaded_at = time.monotonic()
+        return ward_codes.get(candidate_type)
+    finally:
+        _ward_code_cache_lock.release()
+
+def _candidates_query(ward_code):
+    """
+    Return the candidates-by-ward statement for a validated ward code field name.
+    """
+    query = _candidates_queries.get(ward_code)
+    if query is None:
+        if not _IDENTIFIER_RE.fullmatch(ward_code):
+            raise ValueError(f"Invalid ward code field: {ward_code!r}")
+        query = text(f"""
+            SELECT id, name, party, orderno, {ward_code} AS ward_code, candidate_type
+            FROM candidates
+            WHERE {ward_code} = :ward_id
+            AND candidate_type = :candidate_type
+            ORDER BY {ORDERNO_SORT_KEY}, party, name
+        """)
+        _candidates_queries[ward_code] = query
+    return query
 
 def get_candidates_by_ward_id(ward_id, candidate_type='ward'):
     """
@@ -38,46 +213,133 @@ def get_candidates_by_ward_id(ward_id, candidate_type='ward'):
         candidate_type (str): The type of candidates to retrieve (default: 'ward')
     
     Returns:
-        list: List of candidate dictionaries
+        list: List of Candidate rows, empty when the candidate type is unknown
+    
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError: Database errors are not turned into an empty
+            result, so the view answers with an error that is not cached
     """
-    try:
-        # Get the ward code field name
-        ward_code = get_ward_code_for_candidate_type(candidate_type)
-        
-        if not ward_code:
-            logger.error(f"No ward code found for candidate type: {candidate_type}")
-            return []
-        
-        # Query candidates for the specific ward
-        query = f"""
-            SELECT * FROM candidates
-            WHERE {ward_code} = :ward_id
-            AND candidate_type = :candidate_type
-            ORDER BY orderno, party, name
-        """
-        
-        params = {'ward_id': ward_id, 'candidate_type': candidate_type}
-        result = db.session.execute(query, params)
-        
-        # Convert to list of dictionaries
-        candidates = []
-        column_names = result.keys()
-        for row in result:
-            candidate_dict = dict(zip(column_names, row))
-            candidates.append(candidate_dict)
-        
-        return candidates
-        
-    except Exception as e:
-        logger.error(f"Error retrieving candidates for ward {ward_id}: {e}")
+    # Get the ward code field name
+    ward_code = get_ward_code_for_candidate_type(candidate_type)
+    
+    if not ward_code:
+        logger.error("No ward code found for candidate type: %s", candidate_type)
         return []
+    
+    # Query candidates for the specific ward
+    params = {'ward_id': ward_id, 'candidate_type': candidate_type}
+    result = db.session.execute(_candidates_query(ward_code), params)
+    
+    # Convert to list of slotted Candidate rows
+    candidates = [Candidate(*row) for row in result.fetchall()]
+    
+    return candidates
+
+def iter_candidates_by_ward_id(ward_id, candidate_type='ward', batch_size=_STREAM_BATCH_SIZE):
+    """
+    Retrieve the candidates for a specific ward from a server-side cursor, in batches.
+    
+    Args:
+        ward_id (str): The ward identifier
+        candidate_type (str): The type of candidates to retrieve (default: 'ward')
+        batch_size (int): Rows fetched per round trip
+    
+    Returns:
+        iterator: Lists of Candidate rows, None when the candidate type is unknown
+    
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError: The statement runs and the first batch is fetched
+            before returning, so a failed or timed out query still raises here
+    """
+    ward_code = get_ward_code_for_candidate_type(candidate_type)
+    
+    if not ward_code:
+        logger.error("No ward code found for candidate type: %s", candidate_type)
+        return None
+    
+    params = {'ward_id': ward_id, 'candidate_type': candidate_type}
+    connection = db.session.connection().execution_options(
+        stream_results=True, max_row_buffer=batch_size
+    )
+    result = connection.execute(_candidates_query(ward_code), params)
+    first_batch = result.fetchmany(batch_size)
+    
+    def batches():
+        rows = first_batch
+        while rows:
+            yield [Candidate(*row) for row in rows]
+            rows = result.fetchmany(batch_size)
+        result.close()
+    
+    return batches()
+
+def _stream_ward_candidates(ward_id, candidate_type):
+    """
+    Build the ward candidates response body batch by batch from a server-side cursor.
+    Same envelope as the buffered response; errors after the first batch can only be
+    logged, and the client sees a truncated body.
+    """
+    batches = iter_candidates_by_ward_id(ward_id, candidate_type)
+    
+    if batches is None:
+        return _json({
+            'ward_id': ward_id,
+            'candidate_type': candidate_type,
+            'candidates': [],
+            'count': 0,
+            'message': f'No candidates found for ward {ward_id}'
+        }, 200)
+    
+    def generate():
+        # Opening brace and header fields, without the closing brace
+        yield orjson.dumps({'ward_id': ward_id, 'candidate_type': candidate_type})[:-1]
+        yield b',"candidates":['
+        count = 0
+        for batch in batches:
+            if count:
+                yield b','
+            # Comma-joined objects, without the list brackets
+            yield orjson.dumps(batch, default=str)[1:-1]
+            count += len(batch)
+        trailer = {'count': count}
+        if not count:
+            trailer['message'] = f'No candidates found for ward {ward_id}'
+        yield b'],' + orjson.dumps(trailer)[1:]
+    
+    return Response(stream_with_context(generate()), status=200, mimetype='application/json')
 
 def register_api_routes(app):
     """
     Register API routes with the Flask app.
     """
     
-    @app.route('/api/v1/wards/<ward_id>/candidates', methods=['GET'])
+    @app.errorhandler(Exception)
+    def handle_api_error(e):
+        """
+        Turn unhandled errors raised by the API views into JSON responses.
+        HTTP errors and errors outside /api/ keep Flask's default handling.
+        """
+        if isinstance(e, HTTPException):
+            return e
+        if not request.path.startswith('/api/'):
+            raise e
+        
+        if _statement_timed_out(e):
+            logger.warning("Statement timeout in %s: %s", request.path, e)
+            return _json({
+                'error': 'Service unavailable',
+                'message': 'The database took too long to respond'
+            }, 503)
+        
+        logger.error("Error in %s: %s", request.path, e, exc_info=True)
+        return _json({
+            'error': 'Internal server error',
+            'message': 'An error occurred'
+        }, 500)
+    
+    @app.route('/api/v1/wards/<path:ward_id>/candidates', methods=['GET'])
+    @cache.cached(timeout=300, query_string=True, response_filter=_is_cacheable,
+                  unless=_stream_requested)
     def get_ward_candidates(ward_id):
         """
         Get all candidates standing for election in the specified ward.
@@ -87,6 +349,8 @@ def register_api_routes(app):
         
         Query Parameters:
         - candidate_type (str, optional): The type of candidates to retrieve (default: 'ward')
+        - stream (bool, optional): Stream the candidates from a server-side cursor instead of
+          building the whole response in memory; streamed responses are not cached
         
         Returns:
         - JSON array of candidate objects
@@ -103,44 +367,47 @@ def register_api_routes(app):
             }
         ]
         """
-        try:
-            # Get candidate_type from query parameters, default to 'ward'
-            candidate_type = request.args.get('candidate_type', 'ward')
-            
-            # Validate ward_id
-            if not ward_id or not ward_id.strip():
-                return jsonify({
-                    'error': 'Invalid ward_id',
-                    'message': 'Ward ID cannot be empty'
-                }), 400
-            
-            # Get candidates for the ward
-            candidates = get_candidates_by_ward_id(ward_id, candidate_type)
-            
-            if not candidates:
-                return jsonify({
-                    'ward_id': ward_id,
-                    'candidate_type': candidate_type,
-                    'candidates': [],
-                    'message': f'No candidates found for ward {ward_id}'
-                }), 200
-            
-            # Return successful response
-            return jsonify({
+        # Get candidate_type from query parameters, default to 'ward'
+        candidate_type = request.args.get('candidate_type', 'ward')
+        
+        # Normalize and validate ward_id
+        ward_id = (ward_id or '').strip()
+        if not ward_id:
+            return _json({
+                'error': 'Invalid ward_id',
+                'message': 'Ward ID cannot be empty'
+            }, 400)
+        if len(ward_id) > _WARD_ID_MAX_LENGTH:
+            return _json({
+                'error': 'Invalid ward_id',
+                'message': f'Ward ID must be at most {_WARD_ID_MAX_LENGTH} characters'
+            }, 400)
+        
+        if _stream_requested():
+            return _stream_ward_candidates(ward_id, candidate_type)
+        
+        # Get candidates for the ward
+        candidates = get_candidates_by_ward_id(ward_id, candidate_type)
+        
+        if not candidates:
+            return _json({
                 'ward_id': ward_id,
                 'candidate_type': candidate_type,
-                'candidates': candidates,
-                'count': len(candidates)
-            }), 200
-            
-        except Exception as e:
-            logger.error(f"Error in get_ward_candidates API: {e}")
-            return jsonify({
-                'error': 'Internal server error',
-                'message': 'An error occurred while retrieving candidates'
-            }), 500
+                'candidates': [],
+                'count': 0,
+                'message': f'No candidates found for ward {ward_id}'
+            }, 200)
+        
+        # Return successful response
+        return _json({
+            'ward_id': ward_id,
+            'candidate_type': candidate_type,
+            'candidates': candidates,
+            'count': len(candidates)
+        }, 200)
     
     @app.route('/api/v1/wards', methods=['GET'])
+    @cache.cached(timeout=300, query_string=True, response_filter=_is_cacheable)
     def get_available_wards():
         """
         Get list of available wards.
@@ -148,38 +415,23 @@ def register_api_routes(app):
         Returns:
         - JSON array of ward objects with their identifiers
         """
-        try:
-            candidate_type = request.args.get('candidate_type', 'ward')
-            
-            # Get the ward code field name
-            ward_code = get_ward_code_for_candidate_type(candidate_type)
-            
-            if not ward_code:
-                return jsonify({
-                    'error': 'No ward data available',
-                    'message': f'No ward code found for candidate type: {candidate_type}'
-                }), 404
-            
-            # Get distinct wards
-            query = f"""
-                SELECT DISTINCT {ward_code} as ward_id
-                FROM candidates
-                WHERE candidate_type = :candidate_type
-                ORDER BY {ward_code}
-            """
-            
-            result = db.session.execute(query, {'candidate_type': candidate_type})
-            wards = [{'ward_id': row[0]} for row in result]
-            
-            return jsonify({
-                'candidate_type': candidate_type,
-                'wards': wards,
-                'count': len(wards)
-            }), 200
-            
-        except Exception as e:
-            logger.error(f"Error in get_available_wards API: {e}")
-            return jsonify({
-                'error': 'Internal server error',
-                'message': 'An error occurred while retrieving wards'
-            }), 500
+        candidate_type = request.args.get('candidate_type', 'ward')
+        
+        # Get the ward code field name
+        ward_code = get_ward_code_for_candidate_type(candidate_type)
+        
+        if not ward_code:
+            return _json({
+                'error': 'No ward data available',
+                'message': f'No ward code found for candidate type: {candidate_type}'
+            }, 404)
+        
+        # Get distinct wards
+        result = db.session.execute(_WARDS_QUERY, {'candidate_type': candidate_type})
+        wards_json, count = result.fetchone()
+        
+        return _json({
+            'candidate_type': candidate_type,
+            'wards': orjson.Fragment(wards_json),
+            'count': count
+        }, 200)
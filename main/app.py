@@ -20,9 +20,36 @@ csrf_protect = CSRFProtect(app)
 # Database
 from flask_sqlalchemy import SQLAlchemy
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Bound the connection pool and statement run time so one slow query cannot pin a worker
+app.config.setdefault('DATABASE_STATEMENT_TIMEOUT', 2000)
+app.config.setdefault('DATABASE_IDLE_IN_TRANSACTION_TIMEOUT', 5000)
+# Each gunicorn worker has its own pool, so Postgres sees up to
+# workers * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW) connections: 4 * (10 + 5) = 60 with
+# the Dockerfile's 4 workers, leaving room for seeding and admin sessions under the default
+# max_connections = 100. Lower these when adding workers.
+app.config.setdefault('DATABASE_POOL_SIZE', 10)
+app.config.setdefault('DATABASE_MAX_OVERFLOW', 5)
+if (app.config.get('SQLALCHEMY_DATABASE_URI') or '').startswith('postgres'):
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+        'pool_pre_ping': True,
+        'pool_size': app.config['DATABASE_POOL_SIZE'],
+        'max_overflow': app.config['DATABASE_MAX_OVERFLOW'],
+        'connect_args': {
+            'options': f"-c statement_timeout={app.config['DATABASE_STATEMENT_TIMEOUT']}"
+                       f" -c idle_in_transaction_session_timeout={app.config['DATABASE_IDLE_IN_TRANSACTION_TIMEOUT']}"
+        },
+    })
 db = SQLAlchemy(app)
 app.config['SECURITY_REGISTERABLE'] = True
 
+# Response cache for the read-only API
+from flask_caching import Cache
+app.config.setdefault('CACHE_TYPE', 'RedisCache')
+app.config.setdefault('CACHE_REDIS_URL', app.config.get('REDIS_URL'))
+app.config.setdefault('CACHE_KEY_PREFIX', 'api_')
+app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+cache = Cache(app)
+
 from flask_sslify import SSLify
 ssl = SSLify(app)
 app.config['WTF_CSRF_ENABLED'] = False
@@ -1,7 +1,8 @@
 import csv
 import json
 from . import *  # noqa
-from ...app import app
+from ...app import app, cache
+from ...api_routes import ORDERNO_SORT_KEY, clear_ward_code_cache, load_ward_codes
 import pandas as pd
 import os
 
@@ -65,6 +66,53 @@ def seed_site_settings(db, excel_file_path):
     except Exception as e:
         print(e)    
 
+def build_ward_list(db, ward_codes=None):
+    """(Re)create the `ward_list` materialized view of distinct wards per candidate type.
+    Safe to run repeatedly, and on its own against an already seeded database.
+    Args:
+        db (session): Database uses sessions and alembic migrations
+        ward_codes (dict): Maps each candidate_type to its ward code field name;
+            read from the locators in the candidates table when omitted
+    Results: 
+        db: ward_list view rebuilt from the current candidates table
+    """
+    # Rebuilding the view scans the whole candidates table, so lift the request-sized
+    # timeouts for the rest of the caller's transaction
+    db.session.execute("SET LOCAL statement_timeout = 0")
+    db.session.execute("SET LOCAL idle_in_transaction_session_timeout = 0")
+
+    if ward_codes is None:
+        ward_codes = load_ward_codes()
+    if not ward_codes:
+        print("No candidate types found, ward_list not built")
+        return
+
+    ward_selects = []
+    for candidate_type, ward_code in ward_codes.items():
+        candidate_type_literal = candidate_type.replace("'", "''")
+        ward_selects.append(f"""
+            SELECT candidate_type, {ward_code} AS ward_id FROM candidates
+            WHERE candidate_type = '{candidate_type_literal}'
+        """)
+
+    # Dropped rather than refreshed, as the ward code fields may change between seeds
+    db.session.execute("DROP MATERIALIZED VIEW IF EXISTS ward_list")
+    db.session.execute(f"CREATE MATERIALIZED VIEW ward_list AS {' UNION '.join(ward_selects)}")
+    db.session.execute("CREATE INDEX idx_ward_list ON ward_list (candidate_type, ward_id)")
+
+def candidates_index_query(ward_code):
+    """Covering index for the ward candidates API lookup, which filters on candidate_type
+    and the ward code field and sorts by numeric orderno, party, name.
+    Args:
+        ward_code (str): Ward code field name of one candidate type
+    Results: 
+        str: CREATE INDEX statement, a no-op when the index already exists
+    """
+    return f"""
+        CREATE INDEX IF NOT EXISTS idx_candidates_{ward_code}_orderno
+        ON candidates (candidate_type, {ward_code}, ({ORDERNO_SORT_KEY}), party, name, orderno, id)
+    """
+
 from collections import Counter
 def seed_data_candidates(db, excel_file_path):
     """Generate a candidate table and add a candidate_type column from the `data_schema` object keys and populate the table by candidate_type. 
@@ -77,6 +125,11 @@ def seed_data_candidates(db, excel_file_path):
     xls = pd.ExcelFile(f'{excel_file_path}')
     df = pd.read_excel(xls, 'site_settings')
     records = []
+    ward_codes = {}
+
+    # Seeding runs as one long transaction, so lift the request-sized timeouts until commit
+    db.session.execute("SET LOCAL statement_timeout = 0")
+    db.session.execute("SET LOCAL idle_in_transaction_session_timeout = 0")
     
     for index, row in df[df['data_schemas'].notna()].iterrows():
         if row["data_schemas"]:
@@ -122,10 +175,18 @@ def seed_data_candidates(db, excel_file_path):
                         VALUES ({', '.join([':' + col for col in row_data_adjusted.keys()])})
                     """
                     db.session.execute(insert_query, row_data_adjusted)
+
+                if not csv_df.empty:
+                    ward_code = locator_values[0]
+                    ward_codes[table_to_candidate_type.get(table_name, 'unknown')] = ward_code
+                    db.session.execute(candidates_index_query(ward_code))
         else:
             print("no such column")
             continue
 
+    if ward_codes:
+        build_ward_list(db, ward_codes)
+
     try:
         db.session.commit()
         print("Session commit to db")
@@ -135,3 +196,11 @@ def seed_data_candidates(db, excel_file_path):
         raise
     finally:
         db.session.close()
+
+    # Only affects this process; web workers pick up new fields when their cache expires
+    clear_ward_code_cache()
+    try:
+        cache.clear()
+    except Exception as e:
+        # The data is already committed; cached API responses expire on their own
+        print("Cache exception: ", e)
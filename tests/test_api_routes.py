@@ -1,52 +1,59 @@
 import pytest
 import json
 from unittest.mock import patch, MagicMock
-from main.app import app
+from urllib.parse import quote
+from psycopg2.extensions import QueryCanceledError
+from sqlalchemy.exc import OperationalError
+from main.app import app, cache
 from main.database.models import db
+from main.api_routes import clear_ward_code_cache
+
+
+@pytest.fixture(scope='module')
+def client():
+    """Test client shared by every test in this module."""
+    app.config['TESTING'] = True
+    return app.test_client()
+
+
+@pytest.fixture(scope='module')
+def mock_candidates():
+    """Mock candidate data."""
+    return [
+        {
+            'id': '1',
+            'name': 'John Doe',
+            'party': 'Democratic Party',
+            'orderno': '1',
+            'ward_code': 'WARD001',
+            'candidate_type': 'ward'
+        },
+        {
+            'id': '2',
+            'name': 'Jane Smith',
+            'party': 'Republican Party',
+            'orderno': '2',
+            'ward_code': 'WARD001',
+            'candidate_type': 'ward'
+        }
+    ]
+
+
+@pytest.fixture(autouse=True)
+def reset_ward_code_cache():
+    """Start every test without cached ward code lookups."""
+    clear_ward_code_cache()
 
 
 class TestWardCandidatesAPI:
     """Test cases for the ward candidates API endpoint."""
     
-    def setup_method(self):
-        """Set up test client and mock data."""
-        self.app = app
-        self.client = app.test_client()
-        self.app.config['TESTING'] = True
-        
-        # Mock candidate data
-        self.mock_candidates = [
-            {
-                'id': '1',
-                'name': 'John Doe',
-                'party': 'Democratic Party',
-                'orderno': '1',
-                'ward_code': 'WARD001',
-                'candidate_type': 'ward'
-            },
-            {
-                'id': '2',
-                'name': 'Jane Smith',
-                'party': 'Republican Party',
-                'orderno': '2',
-                'ward_code': 'WARD001',
-                'candidate_type': 'ward'
-            }
-        ]
-        
-        # Mock ward data
-        self.mock_wards = [
-            {'ward_id': 'WARD001'},
-            {'ward_id': 'WARD002'},
-            {'ward_id': 'WARD003'}
-        ]
-
     @patch('main.api_routes.get_candidates_by_ward_id')
-    def test_get_ward_candidates_success(self, mock_get_candidates):
+    def test_get_ward_candidates_success(self, mock_get_candidates, client, mock_candidates):
         """Test successful retrieval of ward candidates."""
-        mock_get_candidates.return_value = self.mock_candidates
+        mock_get_candidates.return_value = mock_candidates
         
-        response = self.client.get('/api/v1/wards/WARD001/candidates')
+        response = client.get('/api/v1/wards/WARD001/candidates')
         
         assert response.status_code == 200
         data = json.loads(response.data)
@@ -59,11 +66,11 @@ class TestWardCandidatesAPI:
         assert data['candidates'][1]['name'] == 'Jane Smith'
 
     @patch('main.api_routes.get_candidates_by_ward_id')
-    def test_get_ward_candidates_with_candidate_type(self, mock_get_candidates):
+    def test_get_ward_candidates_with_candidate_type(self, mock_get_candidates, client, mock_candidates):
         """Test retrieval with specific candidate type."""
-        mock_get_candidates.return_value = self.mock_candidates
+        mock_get_candidates.return_value = mock_candidates
         
-        response = self.client.get('/api/v1/wards/WARD001/candidates?candidate_type=municipal')
+        response = client.get('/api/v1/wards/WARD001/candidates?candidate_type=municipal')
         
         assert response.status_code == 200
         data = json.loads(response.data)
@@ -72,11 +79,11 @@ class TestWardCandidatesAPI:
         mock_get_candidates.assert_called_once_with('WARD001', 'municipal')
 
     @patch('main.api_routes.get_candidates_by_ward_id')
-    def test_get_ward_candidates_empty_result(self, mock_get_candidates):
+    def test_get_ward_candidates_empty_result(self, mock_get_candidates, client):
         """Test retrieval when no candidates found."""
         mock_get_candidates.return_value = []
         
-        response = self.client.get('/api/v1/wards/WARD999/candidates')
+        response = client.get('/api/v1/wards/WARD999/candidates')
         
         assert response.status_code == 200
         data = json.loads(response.data)
@@ -86,31 +93,157 @@ class TestWardCandidatesAPI:
         assert data['count'] == 0
         assert 'No candidates found' in data['message']
 
-    def test_get_ward_candidates_invalid_ward_id(self):
+    def test_get_ward_candidates_invalid_ward_id(self, client):
         """Test with invalid ward ID."""
-        response = self.client.get('/api/v1/wards//candidates')
+        response = client.get('/api/v1/wards//candidates')
         
         assert response.status_code == 404  # Flask returns 404 for empty path parameter
 
     @patch('main.api_routes.get_candidates_by_ward_id')
-    def test_get_ward_candidates_database_error(self, mock_get_candidates):
+    def test_get_ward_candidates_strips_ward_id(self, mock_get_candidates, client, mock_candidates):
+        """Test that surrounding whitespace is removed from the ward ID."""
+        mock_get_candidates.return_value = mock_candidates
+        
+        response = client.get('/api/v1/wards/%20WARD001%20/candidates')
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        
+        assert data['ward_id'] == 'WARD001'
+        mock_get_candidates.assert_called_once_with('WARD001', 'ward')
+
+    @patch('main.api_routes.get_candidates_by_ward_id')
+    def test_get_ward_candidates_blank_ward_id(self, mock_get_candidates, client):
+        """Test with a ward ID made only of whitespace."""
+        response = client.get('/api/v1/wards/%20%20/candidates')
+        
+        assert response.status_code == 400
+        data = json.loads(response.data)
+        
+        assert data['error'] == 'Invalid ward_id'
+        mock_get_candidates.assert_not_called()
+
+    @patch('main.api_routes.get_candidates_by_ward_id')
+    def test_get_ward_candidates_long_ward_id(self, mock_get_candidates, client):
+        """Test that overlong ward IDs are rejected without a database lookup."""
+        response = client.get(f"/api/v1/wards/{'W' * 101}/candidates")
+        
+        assert response.status_code == 400
+        data = json.loads(response.data)
+        
+        assert data['error'] == 'Invalid ward_id'
+        mock_get_candidates.assert_not_called()
+
+    @patch('main.api_routes.get_candidates_by_ward_id')
+    def test_get_ward_candidates_ward_name(self, mock_get_candidates, client, mock_candidates):
+        """Test that ward names with spaces, apostrophes and slashes reach the lookup."""
+        mock_get_candidates.return_value = mock_candidates
+        
+        for ward_id in ['Homa Bay', "Murang'A", 'Elgeyo/Marakwet']:
+            response = client.get(f'/api/v1/wards/{quote(ward_id)}/candidates')
+            
+            assert response.status_code == 200
+            data = json.loads(response.data)
+            
+            assert data['ward_id'] == ward_id
+            mock_get_candidates.assert_called_with(ward_id, 'ward')
+
+    @patch('main.api_routes.get_candidates_by_ward_id')
+    def test_get_ward_candidates_database_error(self, mock_get_candidates, client):
         """Test handling of database errors."""
         mock_get_candidates.side_effect = Exception("Database connection error")
         
-        response = self.client.get('/api/v1/wards/WARD001/candidates')
+        response = client.get('/api/v1/wards/WARD001/candidates')
         
         assert response.status_code == 500
         data = json.loads(response.data)
         
         assert data['error'] == 'Internal server error'
-        assert 'An error occurred while retrieving candidates' in data['message']
+        assert data['message'] == 'An error occurred'
+
+    @patch('main.api_routes.get_candidates_by_ward_id')
+    def test_get_ward_candidates_success_is_cached(self, mock_get_candidates, client, mock_candidates):
+        """Test that a successful response is written to the response cache."""
+        mock_get_candidates.return_value = mock_candidates
+        
+        with patch.object(cache.cache, 'set') as mock_cache_set:
+            response = client.get('/api/v1/wards/WARD001/candidates')
+        
+        assert response.status_code == 200
+        mock_cache_set.assert_called_once()
+
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_candidates_database_error_not_cached(self, mock_execute, client):
+        """Test that a failed database lookup is a 500 that is not written to the response cache."""
+        mock_execute.side_effect = OperationalError('SELECT', {}, Exception("server closed the connection"))
+        
+        with patch.object(cache.cache, 'set') as mock_cache_set:
+            response = client.get('/api/v1/wards/WARD001/candidates')
+        
+        assert response.status_code == 500
+        data = json.loads(response.data)
+        
+        assert data['error'] == 'Internal server error'
+        mock_cache_set.assert_not_called()
+
+    @patch('main.api_routes.get_candidates_by_ward_id')
+    def test_get_ward_candidates_statement_timeout(self, mock_get_candidates, client):
+        """Test that a cancelled slow query is reported as unavailable."""
+        mock_get_candidates.side_effect = OperationalError('SELECT', {}, QueryCanceledError())
+        
+        response = client.get('/api/v1/wards/WARD001/candidates')
+        
+        assert response.status_code == 503
+        data = json.loads(response.data)
+        
+        assert data['error'] == 'Service unavailable'
 
     @patch('main.api_routes.get_ward_code_for_candidate_type')
-    def test_get_ward_candidates_no_ward_code(self, mock_get_ward_code):
+    @patch('main.api_routes.db.session.connection')
+    def test_get_ward_candidates_streamed(self, mock_connection, mock_get_ward_code, client, mock_candidates):
+        """Test that ?stream=true reads from a server-side cursor and is not cached."""
+        mock_get_ward_code.return_value = 'ward_code'
+        rows = [tuple(candidate.values()) for candidate in mock_candidates]
+        mock_result = MagicMock()
+        mock_result.fetchmany.side_effect = [rows[:1], rows[1:], []]
+        mock_connection.return_value.execution_options.return_value.execute.return_value = mock_result
+        
+        with patch.object(cache.cache, 'set') as mock_cache_set:
+            response = client.get('/api/v1/wards/WARD001/candidates?stream=true')
+            data = json.loads(response.data)
+        
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert data['ward_id'] == 'WARD001'
+        assert data['candidates'] == mock_candidates
+        assert data['count'] == 2
+        mock_connection.return_value.execution_options.assert_called_once_with(
+            stream_results=True, max_row_buffer=500
+        )
+        mock_cache_set.assert_not_called()
+
+    @patch('main.api_routes.get_ward_code_for_candidate_type')
+    @patch('main.api_routes.db.session.connection')
+    def test_get_ward_candidates_streamed_database_error(self, mock_connection, mock_get_ward_code, client):
+        """Test that a streamed lookup failing before the first batch is still a 500."""
+        mock_get_ward_code.return_value = 'ward_code'
+        mock_connection.return_value.execution_options.return_value.execute.side_effect = OperationalError(
+            'SELECT', {}, Exception("server closed the connection")
+        )
+        
+        response = client.get('/api/v1/wards/WARD001/candidates?stream=true')
+        
+        assert response.status_code == 500
+        data = json.loads(response.data)
+        
+        assert data['error'] == 'Internal server error'
+
+    @patch('main.api_routes.get_ward_code_for_candidate_type')
+    def test_get_ward_candidates_no_ward_code(self, mock_get_ward_code, client):
         """Test when ward code cannot be determined."""
         mock_get_ward_code.return_value = None
         
-        response = self.client.get('/api/v1/wards/WARD001/candidates')
+        response = client.get('/api/v1/wards/WARD001/candidates')
         
         assert response.status_code == 200
         data = json.loads(response.data)
@@ -121,25 +254,21 @@ class TestWardCandidatesAPI:
 class TestAvailableWardsAPI:
     """Test cases for the available wards API endpoint."""
     
-    def setup_method(self):
-        """Set up test client."""
-        self.app = app
-        self.client = app.test_client()
-        self.app.config['TESTING'] = True
-
     @patch('main.api_routes.db.session.execute')
-    def test_get_available_wards_success(self, mock_execute):
+    def test_get_available_wards_success(self, mock_execute, client):
         """Test successful retrieval of available wards."""
         # Mock the database result
         mock_result = MagicMock()
-        mock_result.__iter__ = lambda self: iter([('WARD001',), ('WARD002',), ('WARD003',)])
+        mock_result.fetchone.return_value = (
+            '[{"ward_id": "WARD001"}, {"ward_id": "WARD002"}, {"ward_id": "WARD003"}]', 3
+        )
         mock_execute.return_value = mock_result
         
         # Mock get_ward_code_for_candidate_type
         with patch('main.api_routes.get_ward_code_for_candidate_type') as mock_get_ward_code:
             mock_get_ward_code.return_value = 'ward_code'
             
-            response = self.client.get('/api/v1/wards')
+            response = client.get('/api/v1/wards')
             
             assert response.status_code == 200
             data = json.loads(response.data)
@@ -150,16 +279,16 @@ class TestAvailableWardsAPI:
             assert data['wards'][0]['ward_id'] == 'WARD001'
 
     @patch('main.api_routes.get_ward_code_for_candidate_type')
-    def test_get_available_wards_with_candidate_type(self, mock_get_ward_code):
+    def test_get_available_wards_with_candidate_type(self, mock_get_ward_code, client):
         """Test retrieval with specific candidate type."""
         mock_get_ward_code.return_value = 'municipal_code'
         
         with patch('main.api_routes.db.session.execute') as mock_execute:
             mock_result = MagicMock()
-            mock_result.__iter__ = lambda self: iter([('WARD001',), ('WARD002',)])
+            mock_result.fetchone.return_value = ('[{"ward_id": "WARD001"}, {"ward_id": "WARD002"}]', 2)
             mock_execute.return_value = mock_result
             
-            response = self.client.get('/api/v1/wards?candidate_type=municipal')
+            response = client.get('/api/v1/wards?candidate_type=municipal')
             
             assert response.status_code == 200
             data = json.loads(response.data)
@@ -167,11 +296,11 @@ class TestAvailableWardsAPI:
             assert data['candidate_type'] == 'municipal'
 
     @patch('main.api_routes.get_ward_code_for_candidate_type')
-    def test_get_available_wards_no_ward_code(self, mock_get_ward_code):
+    def test_get_available_wards_no_ward_code(self, mock_get_ward_code, client):
         """Test when ward code cannot be determined."""
         mock_get_ward_code.return_value = None
         
-        response = self.client.get('/api/v1/wards')
+        response = client.get('/api/v1/wards')
         
         assert response.status_code == 404
         data = json.loads(response.data)
@@ -179,14 +308,14 @@ class TestAvailableWardsAPI:
         assert data['error'] == 'No ward data available'
 
     @patch('main.api_routes.db.session.execute')
-    def test_get_available_wards_database_error(self, mock_execute):
+    def test_get_available_wards_database_error(self, mock_execute, client):
         """Test handling of database errors."""
         mock_execute.side_effect = Exception("Database connection error")
         
         with patch('main.api_routes.get_ward_code_for_candidate_type') as mock_get_ward_code:
             mock_get_ward_code.return_value = 'ward_code'
             
-            response = self.client.get('/api/v1/wards')
+            response = client.get('/api/v1/wards')
             
             assert response.status_code == 500
             data = json.loads(response.data)
@@ -194,15 +323,30 @@ class TestAvailableWardsAPI:
             assert data['error'] == 'Internal server error'
 
 
+class TestCandidatesQuery:
+    """Test cases for the candidates-by-ward statement and its index."""
+    
+    def test_candidates_query_orders_by_numeric_orderno(self):
+        """Test that candidates are sorted by the numeric orderno key, then party and name."""
+        from main.api_routes import ORDERNO_SORT_KEY, _candidates_query
+        
+        query = str(_candidates_query('ward_code'))
+        
+        assert f'ORDER BY {ORDERNO_SORT_KEY}, party, name' in query
+
+    def test_candidates_index_matches_query_order(self):
+        """Test that the seeded index uses the same sort key expression as the query."""
+        from main.api_routes import ORDERNO_SORT_KEY
+        from main.database.models.build_db import candidates_index_query
+        
+        query = candidates_index_query('ward_code')
+        
+        assert f'(candidate_type, ward_code, ({ORDERNO_SORT_KEY}), party, name' in query
+
+
 class TestWardCodeHelper:
     """Test cases for the ward code helper function."""
     
-    def setup_method(self):
-        """Set up test client."""
-        self.app = app
-        self.client = app.test_client()
-        self.app.config['TESTING'] = True
-
     @patch('main.api_routes.db.session.execute')
     def test_get_ward_code_for_candidate_type_success(self, mock_execute):
         """Test successful retrieval of ward code."""
@@ -210,7 +354,20 @@ class TestWardCodeHelper:
         
         # Mock database result
         mock_result = MagicMock()
-        mock_result.fetchone.return_value = ('ward', '{"ward_code,ward_name"}')
+        mock_result.fetchall.return_value = [('ward', '{"ward_code,ward_name"}')]
+        mock_execute.return_value = mock_result
+        
+        ward_code = get_ward_code_for_candidate_type('ward')
+        
+        assert ward_code == 'ward_code'
+
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_single_field(self, mock_execute):
+        """Test a locator holding only the ward code field."""
+        from main.api_routes import get_ward_code_for_candidate_type
+        
+        mock_result = MagicMock()
+        mock_result.fetchall.return_value = [('ward', '{ward_code}')]
         mock_execute.return_value = mock_result
         
         ward_code = get_ward_code_for_candidate_type('ward')
@@ -224,7 +381,7 @@ class TestWardCodeHelper:
         
         # Mock database result
         mock_result = MagicMock()
-        mock_result.fetchone.return_value = None
+        mock_result.fetchall.return_value = []
         mock_execute.return_value = mock_result
         
         ward_code = get_ward_code_for_candidate_type('ward')
@@ -238,9 +395,143 @@ class TestWardCodeHelper:
         
         mock_execute.side_effect = Exception("Database error")
         
-        ward_code = get_ward_code_for_candidate_type('ward')
+        with pytest.raises(Exception):
+            get_ward_code_for_candidate_type('ward')
+
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_statement_timeout(self, mock_execute):
+        """Test that statement timeouts are raised rather than treated as missing data."""
+        from main.api_routes import get_ward_code_for_candidate_type
         
-        assert ward_code is None
+        mock_execute.side_effect = OperationalError('SELECT', {}, QueryCanceledError())
+        
+        with pytest.raises(OperationalError):
+            get_ward_code_for_candidate_type('ward')
+
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_cached(self, mock_execute):
+        """Test that a found ward code is only queried once."""
+        from main.api_routes import get_ward_code_for_candidate_type
+        
+        mock_result = MagicMock()
+        mock_result.fetchall.return_value = [('ward', '{ward_code,ward_name}')]
+        mock_execute.return_value = mock_result
+        
+        assert get_ward_code_for_candidate_type('ward') == 'ward_code'
+        assert get_ward_code_for_candidate_type('ward') == 'ward_code'
+        
+        mock_execute.assert_called_once()
+
+    @patch('main.api_routes.time.monotonic')
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_cache_expires(self, mock_execute, mock_monotonic):
+        """Test that cached ward codes are reloaded once they are older than the TTL."""
+        from main.api_routes import _WARD_CODE_CACHE_TTL, get_ward_code_for_candidate_type
+        
+        first_result = MagicMock()
+        first_result.fetchall.return_value = [('ward', '{ward_code,ward_name}')]
+        second_result = MagicMock()
+        second_result.fetchall.return_value = [('ward', '{ward_id,ward_name}')]
+        mock_execute.side_effect = [first_result, second_result]
+        
+        mock_monotonic.return_value = 1000.0
+        assert get_ward_code_for_candidate_type('ward') == 'ward_code'
+        
+        mock_monotonic.return_value = 1000.0 + _WARD_CODE_CACHE_TTL - 1
+        assert get_ward_code_for_candidate_type('ward') == 'ward_code'
+        
+        mock_monotonic.return_value = 1000.0 + _WARD_CODE_CACHE_TTL
+        assert get_ward_code_for_candidate_type('ward') == 'ward_id'
+        
+        assert mock_execute.call_count == 2
+
+    @patch('main.api_routes.time.monotonic')
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_single_reload(self, mock_execute, mock_monotonic):
+        """Test that an expired cache is served as-is while another request reloads it."""
+        from main.api_routes import (
+            _WARD_CODE_CACHE_TTL, _ward_code_cache_lock, get_ward_code_for_candidate_type
+        )
+        
+        mock_result = MagicMock()
+        mock_result.fetchall.return_value = [('ward', '{ward_code,ward_name}')]
+        mock_execute.return_value = mock_result
+        
+        mock_monotonic.return_value = 1000.0
+        assert get_ward_code_for_candidate_type('ward') == 'ward_code'
+        
+        mock_monotonic.return_value = 1000.0 + _WARD_CODE_CACHE_TTL
+        with _ward_code_cache_lock:
+            assert get_ward_code_for_candidate_type('ward') == 'ward_code'
+        
+        mock_execute.assert_called_once()
+
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_loads_all_types(self, mock_execute):
+        """Test that one lookup caches the ward code of every candidate type."""
+        from main.api_routes import get_ward_code_for_candidate_type
+        
+        mock_result = MagicMock()
+        mock_result.fetchall.return_value = [
+            ('ward', '{ward_code,ward_name}'),
+            ('municipal', '{municipal_code,municipal_name}')
+        ]
+        mock_execute.return_value = mock_result
+        
+        assert get_ward_code_for_candidate_type('ward') == 'ward_code'
+        assert get_ward_code_for_candidate_type('municipal') == 'municipal_code'
+        
+        mock_execute.assert_called_once()
+
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_unknown_type_cached(self, mock_execute):
+        """Test that unknown candidate types do not repeat the full locator scan."""
+        from main.api_routes import get_ward_code_for_candidate_type
+        
+        mock_result = MagicMock()
+        mock_result.fetchall.return_value = [('ward', '{ward_code,ward_name}')]
+        mock_execute.return_value = mock_result
+        
+        assert get_ward_code_for_candidate_type('bogus') is None
+        assert get_ward_code_for_candidate_type('bogus') is None
+        assert get_ward_code_for_candidate_type('ward') == 'ward_code'
+        
+        mock_execute.assert_called_once()
+
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_invalid_field(self, mock_execute):
+        """Test that a ward code field that is not a plain identifier is rejected."""
+        from main.api_routes import get_ward_code_for_candidate_type
+        
+        mock_result = MagicMock()
+        mock_result.fetchall.return_value = [('ward', '{ward_code; DROP TABLE candidates,ward_name}')]
+        mock_execute.return_value = mock_result
+        
+        assert get_ward_code_for_candidate_type('ward') is None
+
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_trailing_newline(self, mock_execute):
+        """Test that a ward code field with a trailing newline is rejected."""
+        from main.api_routes import get_ward_code_for_candidate_type
+        
+        mock_result = MagicMock()
+        mock_result.fetchall.return_value = [('ward', '{ward_code\n,ward_name}')]
+        mock_execute.return_value = mock_result
+        
+        assert get_ward_code_for_candidate_type('ward') is None
+
+    @patch('main.api_routes.db.session.execute')
+    def test_get_ward_code_for_candidate_type_error_not_cached(self, mock_execute):
+        """Test that failed lookups are retried."""
+        from main.api_routes import get_ward_code_for_candidate_type
+        
+        mock_execute.side_effect = Exception("Database error")
+        
+        for _ in range(2):
+            with pytest.raises(Exception):
+                get_ward_code_for_candidate_type('ward')
+        
+        assert mock_execute.call_count == 2
 
 
 if __name__ == '__main__':